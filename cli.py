@@ -5,12 +5,12 @@ Simplified CLI for requirement optimization.
 
 import sys
 import asyncio
-from simple_cli import RequirementOptimizer
+from core_optimizer import EXIT_COMMANDS, get_optimizer
 
 
 async def main():
     """Main CLI entry point."""
-    optimizer = RequirementOptimizer()
+    optimizer = get_optimizer()
     
     print("🎯 Requirement Optimizer")
     print("Transform user input into clear requirement descriptions")
@@ -20,7 +20,7 @@ async def main():
         try:
             user_input = input("Enter your requirement: ").strip()
             
-            if user_input.lower() in ['quit', 'exit', 'q']:
+            if user_input.lower() in EXIT_COMMANDS:
                 print("Goodbye!")
                 break
             
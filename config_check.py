@@ -4,6 +4,7 @@
 """
 
 import os
+import re
 import asyncio
 import aiohttp
 from dotenv import load_dotenv
@@ -11,6 +12,30 @@ from typing import Dict, List, Tuple
 
 load_dotenv()
 
+# 模型调用失败时的常见错误模式，一次扫描响应文本
+RESPONSE_ERROR_RE = re.compile(
+    r"(?P<enable_thinking>enable_thinking)"
+    r"|(?P<invalid_request>invalid_request_error)"
+    r"|(?P<rate_limit>rate_limit)",
+    re.IGNORECASE
+)
+
+# 错误模式对应的建议（按优先级排列）
+RESPONSE_ERROR_SUGGESTIONS = (
+    ("enable_thinking", "API要求设置enable_thinking参数，这已在最新版本中修复"),
+    ("invalid_request", "请求参数有误，请检查模型名称和API兼容性"),
+    ("rate_limit", "API调用频率限制，请稍后重试"),
+)
+
+
+class CheckReport:
+    """一项检查的输出、问题和建议"""
+
+    def __init__(self):
+        self.lines = []
+        self.issues = []
+        self.suggestions = []
+
 
 class ConfigChecker:
     """配置检查器"""
@@ -27,11 +52,18 @@ class ConfigChecker:
         # 检查环境变量
         env_result = self.check_environment_variables()
         
-        # 检查API连接
-        api_result = await self.check_api_connection()
-        
-        # 检查模型可用性
-        model_result = await self.check_model_availability()
+        # 检查API连接和模型可用性：两项网络检查互不依赖，共用一个会话并发执行，
+        # 服务器不可达时总耗时取决于较长的超时而非两者之和；
+        # 各自的输出先缓存，结束后按检查顺序打印，报告仍按检查分组
+        api_report = CheckReport()
+        model_report = CheckReport()
+        async with aiohttp.ClientSession() as session:
+            api_result, model_result = await asyncio.gather(
+                self.check_api_connection(session, api_report),
+                self.check_model_availability(session, model_report)
+            )
+        self._print_report(api_report)
+        self._print_report(model_report)
         
         # 汇总结果
         all_passed = env_result and api_result and model_result
@@ -85,70 +117,69 @@ class ConfigChecker:
         
         return all_good
 
-    async def check_api_connection(self) -> bool:
+    async def check_api_connection(self, session: aiohttp.ClientSession, report: CheckReport) -> bool:
         """检查API连接"""
-        print("\n🌐 检查API连接...")
+        report.lines.append("\n🌐 检查API连接...")
         
         api_url = os.getenv("API_BASE_URL")
         if not api_url:
-            print("❌ API_BASE_URL 未设置，跳过连接检查")
+            report.lines.append("❌ API_BASE_URL 未设置，跳过连接检查")
             return False
         
         try:
             # 尝试连接API根路径和models端点
-            async with aiohttp.ClientSession() as session:
-                # 先尝试访问models端点，这通常是更好的健康检查方式
-                models_url = f"{api_url.rstrip('/')}/models"
-                
-                api_key = os.getenv("API_KEY")
-                headers = {}
-                if api_key:
-                    headers["Authorization"] = f"Bearer {api_key}"
-                
-                async with session.get(models_url, headers=headers, timeout=aiohttp.ClientTimeout(total=10)) as response:
-                    if response.status == 200:
-                        print(f"✅ API服务器可访问: {api_url}")
-                        return True
-                    elif response.status == 401:
-                        print(f"⚠️  API需要认证，但可访问: {api_url}")
-                        return True  # 服务器可访问，只是需要认证
-                    elif response.status == 404:
-                        # 如果models端点不存在，尝试根路径
-                        async with session.get(api_url, timeout=aiohttp.ClientTimeout(total=10)) as root_response:
-                            if root_response.status in [200, 404]:  # 404也表示服务器可访问
-                                print(f"✅ API服务器可访问: {api_url}")
-                                return True
-                            else:
-                                print(f"⚠️  API服务器响应异常: HTTP {root_response.status}")
-                                self.suggestions.append("检查API服务器是否正常运行")
-                                return False
-                    else:
-                        print(f"⚠️  API服务器响应异常: HTTP {response.status}")
-                        self.suggestions.append("检查API服务器是否正常运行")
-                        return False
-        
+            # 先尝试访问models端点，这通常是更好的健康检查方式
+            models_url = f"{api_url.rstrip('/')}/models"
+            
+            api_key = os.getenv("API_KEY")
+            headers = {}
+            if api_key:
+                headers["Authorization"] = f"Bearer {api_key}"
+            
+            async with session.get(models_url, headers=headers, timeout=aiohttp.ClientTimeout(total=10)) as response:
+                if response.status == 200:
+                    report.lines.append(f"✅ API服务器可访问: {api_url}")
+                    return True
+                elif response.status == 401:
+                    report.lines.append(f"⚠️  API需要认证，但可访问: {api_url}")
+                    return True  # 服务器可访问，只是需要认证
+                elif response.status == 404:
+                    # 如果models端点不存在，尝试根路径
+                    async with session.get(api_url, timeout=aiohttp.ClientTimeout(total=10)) as root_response:
+                        if root_response.status in [200, 404]:  # 404也表示服务器可访问
+                            report.lines.append(f"✅ API服务器可访问: {api_url}")
+                            return True
+                        else:
+                            report.lines.append(f"⚠️  API服务器响应异常: HTTP {root_response.status}")
+                            report.suggestions.append("检查API服务器是否正常运行")
+                            return False
+                else:
+                    report.lines.append(f"⚠️  API服务器响应异常: HTTP {response.status}")
+                    report.suggestions.append("检查API服务器是否正常运行")
+                    return False
+    
         except asyncio.TimeoutError:
-            print(f"❌ API服务器连接超时: {api_url}")
-            self.issues.append("API连接超时")
-            self.suggestions.append("检查网络连接和API服务器地址")
+            report.lines.append(f"❌ API服务器连接超时: {api_url}")
+            report.issues.append("API连接超时")
+            report.suggestions.append("检查网络连接和API服务器地址")
             return False
         
         except Exception as e:
-            print(f"❌ API连接失败: {str(e)}")
-            self.issues.append(f"API连接错误: {str(e)}")
-            self.suggestions.append("检查API_BASE_URL配置和网络连接")
+            report.lines.append(f"❌ API连接失败: {str(e)}")
+            report.issues.append(f"API连接错误: {str(e)}")
+            report.suggestions.append("检查API_BASE_URL配置和网络连接")
             return False
 
-    async def check_model_availability(self) -> bool:
+    async def check_model_availability(self, session: aiohttp.ClientSession, report: CheckReport) -> bool:
         """检查模型可用性"""
-        print("\n🤖 检查模型可用性...")
+        report.lines.append("\n🤖 检查模型可用性...")
         
         api_url = os.getenv("API_BASE_URL")
         model_name = os.getenv("AI_MODEL")
         api_key = os.getenv("API_KEY")
         
         if not api_url or not model_name:
-            print("❌ API配置不完整，跳过模型检查")
+            report.lines.append("❌ API配置不完整，跳过模型检查")
             return False
         
         try:
@@ -165,67 +196,71 @@ class ConfigChecker:
                 "enable_thinking": False  # Required for some APIs like Qwen/Dashscope
             }
             
-            async with aiohttp.ClientSession() as session:
-                chat_url = f"{api_url.rstrip('/')}/chat/completions"
-                async with session.post(
-                    chat_url, 
-                    json=data, 
-                    headers=headers,
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as response:
-                    
-                    if response.status == 200:
-                        print(f"✅ 模型可用: {model_name}")
-                        return True
-                    elif response.status == 401:
-                        print(f"❌ 认证失败: 请检查API_KEY")
-                        self.issues.append("API认证失败")
-                        self.suggestions.append("检查API_KEY是否正确")
-                        return False
-                    elif response.status == 404:
-                        print(f"❌ 模型不存在: {model_name}")
-                        self.issues.append(f"模型 {model_name} 不可用")
-                        self.suggestions.append("检查AI_MODEL配置，确保模型名称正确")
-                        return False
-                    else:
-                        try:
-                            response_text = await response.text()
-                            print(f"❌ 模型调用失败: HTTP {response.status}")
+            chat_url = f"{api_url.rstrip('/')}/chat/completions"
+            async with session.post(
+                chat_url, 
+                json=data, 
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=30)
+            ) as response:
+                
+                if response.status == 200:
+                    report.lines.append(f"✅ 模型可用: {model_name}")
+                    return True
+                elif response.status == 401:
+                    report.lines.append(f"❌ 认证失败: 请检查API_KEY")
+                    report.issues.append("API认证失败")
+                    report.suggestions.append("检查API_KEY是否正确")
+                    return False
+                elif response.status == 404:
+                    report.lines.append(f"❌ 模型不存在: {model_name}")
+                    report.issues.append(f"模型 {model_name} 不可用")
+                    report.suggestions.append("检查AI_MODEL配置，确保模型名称正确")
+                    return False
+                else:
+                    try:
+                        response_text = await response.text()
+                        report.lines.append(f"❌ 模型调用失败: HTTP {response.status}")
+                        
+                        # 尝试解析错误信息
+                        if response_text:
+                            # 限制显示的响应长度
+                            display_text = response_text[:300] + "..." if len(response_text) > 300 else response_text
+                            report.lines.append(f"响应: {display_text}")
                             
-                            # 尝试解析错误信息
-                            if response_text:
-                                # 限制显示的响应长度
-                                display_text = response_text[:300] + "..." if len(response_text) > 300 else response_text
-                                print(f"响应: {display_text}")
+                            # 检查常见错误模式
+                            hits = {match.lastgroup for match in RESPONSE_ERROR_RE.finditer(response_text)}
+                            suggestion = next(
+                                (text for pattern, text in RESPONSE_ERROR_SUGGESTIONS if pattern in hits),
+                                "模型调用失败，请检查API服务器和模型配置"
+                            )
+                            report.suggestions.append(suggestion)
                                 
-                                # 检查常见错误模式
-                                if "enable_thinking" in response_text.lower():
-                                    self.suggestions.append("API要求设置enable_thinking参数，这已在最新版本中修复")
-                                elif "invalid_request_error" in response_text.lower():
-                                    self.suggestions.append("请求参数有误，请检查模型名称和API兼容性")
-                                elif "rate_limit" in response_text.lower():
-                                    self.suggestions.append("API调用频率限制，请稍后重试")
-                                else:
-                                    self.suggestions.append("模型调用失败，请检查API服务器和模型配置")
-                                    
-                            self.issues.append(f"模型调用失败: HTTP {response.status}")
-                            return False
-                        except Exception:
-                            print(f"❌ 模型调用失败: HTTP {response.status} (响应解析失败)")
-                            self.issues.append(f"模型调用失败: HTTP {response.status}")
-                            return False
-        
+                        report.issues.append(f"模型调用失败: HTTP {response.status}")
+                        return False
+                    except Exception:
+                        report.lines.append(f"❌ 模型调用失败: HTTP {response.status} (响应解析失败)")
+                        report.issues.append(f"模型调用失败: HTTP {response.status}")
+                        return False
+    
         except asyncio.TimeoutError:
-            print(f"❌ 模型调用超时")
-            self.issues.append("模型调用超时")
-            self.suggestions.append("模型响应较慢，可能是服务器负载高")
+            report.lines.append(f"❌ 模型调用超时")
+            report.issues.append("模型调用超时")
+            report.suggestions.append("模型响应较慢，可能是服务器负载高")
             return False
         
         except Exception as e:
-            print(f"❌ 模型检查失败: {str(e)}")
-            self.issues.append(f"模型检查错误: {str(e)}")
+            report.lines.append(f"❌ 模型检查失败: {str(e)}")
+            report.issues.append(f"模型检查错误: {str(e)}")
             return False
 
+    def _print_report(self, report: CheckReport):
+        """按检查顺序输出一项并发检查的结果"""
+        for line in report.lines:
+            print(line)
+        self.issues.extend(report.issues)
+        self.suggestions.extend(report.suggestions)
+
     def _print_summary(self, all_passed: bool):
         """打印检查总结"""
         print("\n" + "=" * 50)
@@ -3,11 +3,16 @@
 Core requirement optimizer logic shared between CLI and Web versions.
 """
 
+import asyncio
 import os
 import re
 import time
-from typing import Optional, Dict, Any
-from openai import AsyncOpenAI
+from collections import OrderedDict
+from functools import lru_cache
+from string import Template
+from typing import Optional, Dict, Any, Callable
+import httpx
+from openai import APIConnectionError, AsyncOpenAI, DefaultAsyncHttpxClient, InternalServerError
 from dotenv import load_dotenv
 from logger_config import get_logger, log_performance
 import uuid
@@ -18,6 +23,141 @@ load_dotenv()
 # Initialize logger
 logger = get_logger(__name__)
 
+# Language is decided by the head of the text; long pasted documents do not
+# need a full scan to tell Chinese from English.
+LANGUAGE_DETECTION_WINDOW = 256
+CHINESE_CHAR_RE = re.compile(r"[\u4e00-\u9fff]")
+
+# Negotiate HTTP/2 with HTTPS API servers so concurrent requests share one connection
+API_HTTP2 = os.getenv("API_HTTP2", "false").lower() == "true"
+
+# Maximum completions in flight at once; further calls wait for a free slot
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "8"))
+
+# Consecutive API failures that open the circuit, and seconds it stays open;
+# while open, calls fail fast instead of waiting on an unreachable server
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = int(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Errors showing the API server is unreachable or failing (connection, timeout, 5xx);
+# only these count toward the circuit, not errors about the request itself
+CIRCUIT_FAILURE_ERRORS = (APIConnectionError, InternalServerError, httpx.TransportError)
+
+# Longest user message sent to the API; longer input is rejected up front
+# instead of being silently truncated by the model server's context window
+MAX_INPUT_CHARS = int(os.getenv("MAX_INPUT_CHARS", "8000"))
+
+# Maximum cached API results (least recently used are evicted)
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+# Seconds a cached API result stays valid
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "1800"))
+
+# Result mode when the API could not be used and the input was only cleaned up locally
+FALLBACK_MODE = "回退模式"
+
+# Session result types that carry an AI-generated requirement description
+AI_RESPONSE_TYPES = frozenset({"ai_response", "ai_response_refined"})
+
+# Feedback commands that start a new conversation
+NEW_CONVERSATION_COMMANDS = frozenset({"/n", "n"})
+
+# Inputs that leave the interactive CLI loops
+EXIT_COMMANDS = frozenset({"quit", "exit", "q"})
+
+# User message templates for refinement requests
+REFINEMENT_MESSAGE_ZH = Template("之前的需求描述：$initial_result\n用户反馈：$feedback")
+REFINEMENT_MESSAGE_EN = Template("Previous requirement description: $initial_result\nUser feedback: $feedback")
+
+# System prompts by mode and language
+OPTIMIZATION_PROMPT_ZH = """你是一个需求分析专家，同时也是Excel和Word专家。你的任务是将用户的原始输入转化为清晰、准确的需求描述。
+
+要求：
+1. 只描述用户想要什么，不要添加如何实现的建议
+2. 使用简洁、专业的语言
+3. 保持需求的核心意图
+4. 去除冗余信息
+5. 确保描述完整且明确
+6. 如果涉及Excel或Word功能，准确理解相关术语和需求
+7. 输出结果必须以列表形式展示，每个需求点用数字编号
+
+请将以下用户输入转化为清晰的需求描述："""
+
+OPTIMIZATION_PROMPT_EN = """You are a requirement analysis expert and also an Excel and Word expert. Your task is to transform the user's raw input into a clear, accurate requirement description.
+
+Requirements:
+1. Only describe what the user wants, do not add suggestions on how to implement
+2. Use concise, professional language
+3. Maintain the core intent of the requirement
+4. Remove redundant information
+5. Ensure the description is complete and clear
+6. If involving Excel or Word features, accurately understand related terms and requirements
+7. Output result must be in list format, with each requirement point numbered
+
+Please transform the following user input into a clear requirement description:"""
+
+REFINEMENT_PROMPT_ZH = """你是一个需求分析专家，同时也是Excel和Word专家。根据用户的反馈，调整和优化之前的需求描述。
+
+要求：
+1. 根据用户反馈调整需求描述
+2. 保持专业和简洁
+3. 确保调整后的描述更符合用户意图
+4. 不要添加实现建议，只描述需求
+5. 如果涉及Excel或Word功能，准确理解相关术语和需求
+6. 输出结果必须以列表形式展示，每个需求点用数字编号
+
+请提供调整后的需求描述："""
+
+REFINEMENT_PROMPT_EN = """You are a requirement analysis expert and also an Excel and Word expert. Based on user feedback, adjust and optimize the previous requirement description.
+
+Requirements:
+1. Adjust requirement description based on user feedback
+2. Keep it professional and concise
+3. Ensure the adjusted description better matches user intent
+4. Do not add implementation suggestions, only describe requirements
+5. If involving Excel or Word features, accurately understand related terms and requirements
+6. Output result must be in list format, with each requirement point numbered
+
+Please provide the adjusted requirement description:"""
+
+# Error message keywords tagged by category, matched in a single pass
+ERROR_KEYWORDS_RE = re.compile(
+    r"(?P<connection>connection|timeout|network)"
+    r"|(?P<auth>unauthorized|401|api key)"
+    r"|(?P<rate_limit>rate limit|429)"
+    r"|(?P<model>model)"
+    r"|(?P<not_found>not found|404)"
+    r"|(?P<server>500|502|503)"
+    r"|(?P<parse>json|parse)",
+    re.IGNORECASE
+)
+
+# Filler phrases removed by the fallback cleaner, tried in order at the start of input
+FILLER_PATTERNS = (
+    "please help me", "can you help me", "i need help with",
+    "i want to", "i would like to", "could you", "can you",
+    "请帮我", "你能帮我", "我想要", "我需要", "能不能", "可以吗"
+)
+FILLER_PREFIX_RE = re.compile("|".join(map(re.escape, FILLER_PATTERNS)))
+
+# Prompts specialized per (mode, is_chinese) so lookup is a single dict probe
+SYSTEM_PROMPTS = {
+    ("optimization", True): OPTIMIZATION_PROMPT_ZH,
+    ("optimization", False): OPTIMIZATION_PROMPT_EN,
+    ("refinement", True): REFINEMENT_PROMPT_ZH,
+    ("refinement", False): REFINEMENT_PROMPT_EN,
+}
+
+
+class ErrorInfo:
+    """Classified API error with a user-facing message and suggestion."""
+
+    __slots__ = ("error_type", "message", "suggestion")
+
+    def __init__(self, error_type: str, message: str, suggestion: str):
+        self.error_type = error_type
+        self.message = message
+        self.suggestion = suggestion
+
 
 class RequirementOptimizer:
     """
@@ -49,28 +189,57 @@ class RequirementOptimizer:
 
         self.client = AsyncOpenAI(
             base_url=api_base_url,
-            api_key=api_key
+            api_key=api_key,
+            http_client=DefaultAsyncHttpxClient(http2=API_HTTP2)
         )
+
+        # Bounds concurrent completions across all sessions sharing this optimizer
+        self._request_slots = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+        # Successful API results with their expiry, keyed by (system prompt, user message),
+        # in LRU order
+        self._response_cache: OrderedDict = OrderedDict()
+
+        # Futures of API calls in progress, keyed like the response cache
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+
+        # Circuit breaker state for the API server; once the open window has passed
+        # the circuit is half-open and a single trial call is let through
+        self._consecutive_failures = 0
+        self._circuit_open_until = 0.0
+        self._circuit_trial: Optional[asyncio.Future] = None
         logger.info("RequirementOptimizer initialized successfully")
 
-    async def optimize_requirement(self, user_input: str) -> Dict[str, Any]:
+    async def optimize_requirement(
+        self, user_input: str, on_chunk: Optional[Callable[[str], None]] = None
+    ) -> Dict[str, Any]:
         """
         Optimize user input to clearly describe the requirement.
 
         Args:
             user_input: Raw user input describing what they want
+            on_chunk: Optional callback receiving response text as it streams in
 
         Returns:
-            Dict with result, response_time, mode, and optional error
+            Dict with result, response_time, mode, optional cached flag, and optional error
         """
         logger.info(f"Starting requirement optimization for input: {user_input[:50]}...")
         start_time = time.time()
-        
+
+        # Blank input has nothing to optimize; skip prompt building and the API call
+        if not user_input.strip():
+            logger.warning("Empty input, using fallback mode for requirement optimization")
+            return {
+                "result": "",
+                "response_time": 0,
+                "mode": FALLBACK_MODE
+            }
+
         # Get system prompt based on language and thinking mode
-        system_prompt = self._get_optimization_prompt(user_input)
+        system_prompt = self._get_optimization_prompt(self._detect_chinese(user_input))
 
         # Try the configured OpenAI-compatible API
-        result = await self._call_api(system_prompt, user_input)
+        result = await self._call_api(system_prompt, user_input, on_chunk)
         if result:
             duration = time.time() - start_time
             log_performance("requirement_optimization", duration)
@@ -83,36 +252,45 @@ class RequirementOptimizer:
         return {
             "result": self._simple_clean(user_input),
             "response_time": 0,
-            "mode": "回退模式"
+            "mode": FALLBACK_MODE
         }
 
-    async def refine_requirement(self, initial_result: str, feedback: str) -> Dict[str, Any]:
+    async def refine_requirement(
+        self, initial_result: str, feedback: str, on_chunk: Optional[Callable[[str], None]] = None
+    ) -> Dict[str, Any]:
         """
         Refine requirement based on user feedback.
 
         Args:
             initial_result: Initial AI response
             feedback: User feedback for refinement
+            on_chunk: Optional callback receiving response text as it streams in
 
         Returns:
-            Dict with refined result, response_time, mode, and optional error
+            Dict with refined result, response_time, mode, optional cached flag, and optional error
         """
         logger.info(f"Starting requirement refinement with feedback: {feedback[:50]}...")
         start_time = time.time()
-        
+
+        # Blank feedback leaves the requirement unchanged; skip prompt building and the API call
+        if not feedback.strip():
+            logger.warning("Empty feedback, using fallback mode for requirement refinement")
+            return {
+                "result": initial_result,
+                "response_time": 0,
+                "mode": FALLBACK_MODE
+            }
+
         # Get refinement prompt based on language
-        system_prompt = self._get_refinement_prompt(feedback)
+        is_chinese = self._detect_chinese(feedback)
+        system_prompt = self._get_refinement_prompt(is_chinese)
 
         # Prepare user message
-        is_chinese = self._detect_chinese(feedback)
-        user_message = (
-            f"之前的需求描述：{initial_result}\n用户反馈：{feedback}"
-            if is_chinese
-            else f"Previous requirement description: {initial_result}\nUser feedback: {feedback}"
-        )
+        message_template = REFINEMENT_MESSAGE_ZH if is_chinese else REFINEMENT_MESSAGE_EN
+        user_message = message_template.substitute(initial_result=initial_result, feedback=feedback)
 
         # Try the configured OpenAI-compatible API
-        result = await self._call_api(system_prompt, user_message)
+        result = await self._call_api(system_prompt, user_message, on_chunk)
         if result:
             duration = time.time() - start_time
             log_performance("requirement_refinement", duration)
@@ -126,209 +304,310 @@ class RequirementOptimizer:
         return {
             "result": f"{initial_result}\n\n{feedback_note}",
             "response_time": 0,
-            "mode": "回退模式"
+            "mode": FALLBACK_MODE
         }
 
-    def _get_prompt(self, text: str, mode: str = "optimization") -> str:
+    def _get_prompt(self, is_chinese: bool, mode: str = "optimization") -> str:
         """
         Get system prompt for requirement processing.
 
         Args:
-            text: Input text to detect language
+            is_chinese: Whether the input being processed is Chinese
             mode: "optimization" for initial optimization, "refinement" for feedback-based refinement
         """
-        is_chinese = self._detect_chinese(text)
-
-        if mode == "optimization":
-            if is_chinese:
-                return """你是一个需求分析专家，同时也是Excel和Word专家。你的任务是将用户的原始输入转化为清晰、准确的需求描述。
-
-要求：
-1. 只描述用户想要什么，不要添加如何实现的建议
-2. 使用简洁、专业的语言
-3. 保持需求的核心意图
-4. 去除冗余信息
-5. 确保描述完整且明确
-6. 如果涉及Excel或Word功能，准确理解相关术语和需求
-7. 输出结果必须以列表形式展示，每个需求点用数字编号
-
-请将以下用户输入转化为清晰的需求描述："""
-            else:
-                return """You are a requirement analysis expert and also an Excel and Word expert. Your task is to transform the user's raw input into a clear, accurate requirement description.
-
-Requirements:
-1. Only describe what the user wants, do not add suggestions on how to implement
-2. Use concise, professional language
-3. Maintain the core intent of the requirement
-4. Remove redundant information
-5. Ensure the description is complete and clear
-6. If involving Excel or Word features, accurately understand related terms and requirements
-7. Output result must be in list format, with each requirement point numbered
-
-Please transform the following user input into a clear requirement description:"""
-
-        elif mode == "refinement":
-            if is_chinese:
-                return """你是一个需求分析专家，同时也是Excel和Word专家。根据用户的反馈，调整和优化之前的需求描述。
-
-要求：
-1. 根据用户反馈调整需求描述
-2. 保持专业和简洁
-3. 确保调整后的描述更符合用户意图
-4. 不要添加实现建议，只描述需求
-5. 如果涉及Excel或Word功能，准确理解相关术语和需求
-6. 输出结果必须以列表形式展示，每个需求点用数字编号
-
-请提供调整后的需求描述："""
-            else:
-                return """You are a requirement analysis expert and also an Excel and Word expert. Based on user feedback, adjust and optimize the previous requirement description.
-
-Requirements:
-1. Adjust requirement description based on user feedback
-2. Keep it professional and concise
-3. Ensure the adjusted description better matches user intent
-4. Do not add implementation suggestions, only describe requirements
-5. If involving Excel or Word features, accurately understand related terms and requirements
-6. Output result must be in list format, with each requirement point numbered
-
-Please provide the adjusted requirement description:"""
-
-        else:
+        prompt = SYSTEM_PROMPTS.get((mode, is_chinese))
+        if prompt is None:
             raise ValueError(f"Unknown mode: {mode}")
+        return prompt
 
-    def _get_optimization_prompt(self, user_input: str) -> str:
+    def _get_optimization_prompt(self, is_chinese: bool) -> str:
         """Get system prompt for requirement optimization."""
-        return self._get_prompt(user_input, "optimization")
+        return self._get_prompt(is_chinese, "optimization")
 
-    def _get_refinement_prompt(self, feedback: str) -> str:
+    def _get_refinement_prompt(self, is_chinese: bool) -> str:
         """Get system prompt for requirement refinement."""
-        return self._get_prompt(feedback, "refinement")
+        return self._get_prompt(is_chinese, "refinement")
 
     def _detect_chinese(self, text: str) -> bool:
-        """Detect if text contains Chinese characters."""
-        return any('\u4e00' <= char <= '\u9fff' for char in text)
+        """Detect if the head of text contains Chinese characters."""
+        # Pure ASCII text cannot contain CJK; isascii() is a flag check, not a scan
+        if text.isascii():
+            return False
+        return CHINESE_CHAR_RE.search(text, 0, LANGUAGE_DETECTION_WINDOW) is not None
+
+    async def _call_api(
+        self, system_prompt: str, user_input: str, on_chunk: Optional[Callable[[str], None]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Call OpenAI-compatible API using OpenAI client with detailed error handling.
 
-    async def _call_api(self, system_prompt: str, user_input: str) -> Optional[Dict[str, Any]]:
-        """Call OpenAI-compatible API using OpenAI client with detailed error handling."""
-        logger.debug(f"Making API call to model: {self.model}")
+        When on_chunk is given the completion is streamed and each text delta is
+        passed to it as soon as it arrives; the full result is still returned.
+        Successful results are cached for RESPONSE_CACHE_TTL seconds, so repeated
+        requests skip the API call, and concurrent identical requests share one call.
+        Results served from the cache carry "cached": True.
+        """
         start_time = time.time()
-        try:
-            # Build the request parameters
-            request_params = {
-                "model": self.model,
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_input}
-                ],
-                "max_tokens": 1500,
-                "temperature": 0.1,
-            }
 
-            # Add enable_thinking parameter for compatibility with Qwen and other APIs
-            # For non-streaming calls, it must be set to False
-            request_params["extra_body"] = {"enable_thinking": False}
-
-            # Non-streaming mode
-            response = await self.client.chat.completions.create(**request_params)
-            result = response.choices[0].message.content.strip()
-
-            # Calculate response time
-            response_time = time.time() - start_time
+        if len(user_input) > MAX_INPUT_CHARS:
+            logger.warning(f"Input of {len(user_input)} characters exceeds limit of {MAX_INPUT_CHARS}")
+            return {
+                "error": f"输入内容过长（{len(user_input)}字符，上限{MAX_INPUT_CHARS}字符）",
+                "error_type": "输入过长",
+                "error_suggestion": "请精简需求描述，或开始新对话后分段输入",
+                "response_time": 0
+            }
 
+        # Retried inputs are answered from the cache instead of another round trip
+        cache_key = (system_prompt, user_input)
+        cached = self._get_cached_response(cache_key)
+        if cached is not None:
+            logger.info("Serving API result from response cache")
+            if on_chunk is not None:
+                on_chunk(cached)
             return {
-                "result": result,
-                "response_time": response_time,
-                "mode": "标准模式"
+                "result": cached,
+                "response_time": time.time() - start_time,
+                "mode": "标准模式",
+                "cached": True
             }
 
+        # Identical requests already on their way share that call's outcome
+        pending = self._inflight.get(cache_key)
+        if pending is not None:
+            logger.debug("Joining in-flight API call for identical request")
+            try:
+                result = await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # Only the joined call was cancelled, not this one: make our own call
+                if not pending.cancelled():
+                    raise
+            else:
+                if on_chunk is not None and "result" in result:
+                    on_chunk(result["result"])
+                return dict(result, response_time=time.time() - start_time)
+
+        circuit_trial = False
+        if self._circuit_open_until:
+            if self._circuit_trial is not None or time.monotonic() < self._circuit_open_until:
+                logger.warning("API circuit open, skipping call")
+                return {
+                    "error": "API服务连续调用失败，已暂停请求",
+                    "error_type": "服务暂不可用",
+                    "error_suggestion": f"请检查API服务状态，约{CIRCUIT_RESET_SECONDS}秒后将自动重试",
+                    "response_time": time.time() - start_time
+                }
+            # Half-open: this call is the trial; others keep failing fast until it ends
+            logger.info("API circuit half-open, sending trial call")
+            circuit_trial = True
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[cache_key] = future
+        if circuit_trial:
+            self._circuit_trial = future
+        try:
+            result = await self._request_completion(
+                system_prompt, user_input, on_chunk, cache_key, start_time
+            )
+            future.set_result(result)
+            return result
+        finally:
+            # A trial that ended without an outcome (cancelled, or a failing
+            # callback) leaves the next caller to try instead
+            if self._circuit_trial is future:
+                self._circuit_trial = None
+            if self._inflight.get(cache_key) is future:
+                del self._inflight[cache_key]
+            if not future.done():
+                future.cancel()
+
+    async def _request_completion(
+        self,
+        system_prompt: str,
+        user_input: str,
+        on_chunk: Optional[Callable[[str], None]],
+        cache_key: tuple,
+        start_time: float
+    ) -> Dict[str, Any]:
+        """Send one chat completion request, caching a successful result."""
+        logger.debug(f"Making API call to model: {self.model}")
+        # A failing on_chunk is the caller's error, not the API's: it is raised
+        # after the API error handling instead of being reported as a failed call
+        callback_error = None
+        try:
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_input}
+            ]
+
+            async with self._request_slots:
+                # Add enable_thinking parameter for compatibility with Qwen and other APIs
+                # Thinking output is disabled for both streaming and non-streaming calls
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=1500,
+                    temperature=0.1,
+                    stream=on_chunk is not None,
+                    extra_body={"enable_thinking": False},
+                )
+
+                if on_chunk is None:
+                    # Non-streaming mode
+                    result = response.choices[0].message.content.strip()
+                else:
+                    # Streaming mode: forward deltas before the completion finishes
+                    parts = []
+                    async with response:
+                        async for chunk in response:
+                            if not chunk.choices:
+                                continue
+                            delta = chunk.choices[0].delta.content
+                            if delta:
+                                parts.append(delta)
+                                try:
+                                    on_chunk(delta)
+                                except Exception as e:
+                                    callback_error = e
+                                    break
+                    result = "".join(parts).strip()
         except Exception as e:
             response_time = time.time() - start_time
             error_info = self._format_error(e, response_time)
-            logger.error(f"API call failed after {response_time:.4f}s: {error_info['message']}")
+            logger.error(f"API call failed after {response_time:.4f}s: {error_info.message}")
+
+            if isinstance(e, CIRCUIT_FAILURE_ERRORS):
+                self._record_circuit_failure()
+            else:
+                # The server answered, it just rejected this request
+                self._close_circuit()
 
             return {
-                "error": error_info["message"],
-                "error_type": error_info["type"],
-                "error_suggestion": error_info["suggestion"],
+                "error": error_info.message,
+                "error_type": error_info.error_type,
+                "error_suggestion": error_info.suggestion,
                 "response_time": response_time
             }
 
-    def _format_error(self, error: Exception, response_time: float) -> Dict[str, str]:
+        if callback_error is not None:
+            raise callback_error
+
+        # Calculate response time
+        response_time = time.time() - start_time
+        self._close_circuit()
+
+        if result:
+            self._response_cache[cache_key] = (result, time.monotonic() + RESPONSE_CACHE_TTL)
+            if len(self._response_cache) > RESPONSE_CACHE_SIZE:
+                self._response_cache.popitem(last=False)
+
+        return {
+            "result": result,
+            "response_time": response_time,
+            "mode": "标准模式"
+        }
+
+    def _record_circuit_failure(self):
+        """Count a server failure, opening the circuit at the threshold or on a failed trial."""
+        self._consecutive_failures += 1
+        if self._circuit_trial is not None or self._consecutive_failures >= CIRCUIT_FAILURE_THRESHOLD:
+            self._circuit_open_until = time.monotonic() + CIRCUIT_RESET_SECONDS
+            self._circuit_trial = None
+            logger.warning(
+                f"{self._consecutive_failures} consecutive API failures, "
+                f"pausing calls for {CIRCUIT_RESET_SECONDS}s"
+            )
+
+    def _close_circuit(self):
+        """Reset the circuit after the API server has answered."""
+        if self._circuit_open_until:
+            logger.info("API server answered, closing circuit")
+        self._consecutive_failures = 0
+        self._circuit_open_until = 0.0
+        self._circuit_trial = None
+
+    def _get_cached_response(self, cache_key: tuple) -> Optional[str]:
+        """Return a cached, unexpired API result and mark it recently used."""
+        entry = self._response_cache.get(cache_key)
+        if entry is None:
+            return None
+
+        result, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._response_cache[cache_key]
+            return None
+
+        self._response_cache.move_to_end(cache_key)
+        return result
+
+    def _format_error(self, error: Exception, response_time: float) -> ErrorInfo:
         """Format error with detailed information and suggestions."""
-        error_str = str(error).lower()
+        hits = {match.lastgroup for match in ERROR_KEYWORDS_RE.finditer(str(error))}
 
         # Connection errors
-        if "connection" in error_str or "timeout" in error_str or "network" in error_str:
-            return {
-                "type": "连接错误",
-                "message": f"无法连接到API服务器 ({self.client.base_url})",
-                "suggestion": "请检查网络连接和API服务器地址配置"
-            }
+        if "connection" in hits:
+            return ErrorInfo(
+                error_type="连接错误",
+                message=f"无法连接到API服务器 ({self.client.base_url})",
+                suggestion="请检查网络连接和API服务器地址配置"
+            )
 
         # Authentication errors
-        if "unauthorized" in error_str or "401" in error_str or "api key" in error_str:
-            return {
-                "type": "认证错误",
-                "message": "API密钥验证失败",
-                "suggestion": "请检查.env文件中的API_KEY配置是否正确"
-            }
+        if "auth" in hits:
+            return ErrorInfo(
+                error_type="认证错误",
+                message="API密钥验证失败",
+                suggestion="请检查.env文件中的API_KEY配置是否正确"
+            )
 
         # Rate limit errors
-        if "rate limit" in error_str or "429" in error_str:
-            return {
-                "type": "频率限制",
-                "message": "API调用频率超出限制",
-                "suggestion": "请稍等片刻后重试，或检查API配额"
-            }
+        if "rate_limit" in hits:
+            return ErrorInfo(
+                error_type="频率限制",
+                message="API调用频率超出限制",
+                suggestion="请稍等片刻后重试，或检查API配额"
+            )
 
         # Model not found errors
-        if "model" in error_str and ("not found" in error_str or "404" in error_str):
-            return {
-                "type": "模型错误",
-                "message": f"模型 '{self.model}' 不可用",
-                "suggestion": "请检查.env文件中的AI_MODEL配置，确保模型名称正确"
-            }
+        if "model" in hits and "not_found" in hits:
+            return ErrorInfo(
+                error_type="模型错误",
+                message=f"模型 '{self.model}' 不可用",
+                suggestion="请检查.env文件中的AI_MODEL配置，确保模型名称正确"
+            )
 
         # Server errors
-        if "500" in error_str or "502" in error_str or "503" in error_str:
-            return {
-                "type": "服务器错误",
-                "message": "API服务器内部错误",
-                "suggestion": "服务器暂时不可用，请稍后重试"
-            }
+        if "server" in hits:
+            return ErrorInfo(
+                error_type="服务器错误",
+                message="API服务器内部错误",
+                suggestion="服务器暂时不可用，请稍后重试"
+            )
 
         # JSON or parsing errors
-        if "json" in error_str or "parse" in error_str:
-            return {
-                "type": "响应格式错误",
-                "message": "API响应格式异常",
-                "suggestion": "API服务可能不兼容，请检查API_BASE_URL配置"
-            }
+        if "parse" in hits:
+            return ErrorInfo(
+                error_type="响应格式错误",
+                message="API响应格式异常",
+                suggestion="API服务可能不兼容，请检查API_BASE_URL配置"
+            )
 
         # Generic error
-        return {
-            "type": "未知错误",
-            "message": str(error),
-            "suggestion": "请检查网络连接和API配置，或联系技术支持"
-        }
+        return ErrorInfo(
+            error_type="未知错误",
+            message=str(error),
+            suggestion="请检查网络连接和API配置，或联系技术支持"
+        )
 
     def _simple_clean(self, user_input: str) -> str:
         """Simple fallback cleaning when APIs are unavailable."""
         # Remove common filler words and phrases
         cleaned = user_input.strip()
 
-        # Basic cleaning patterns
-        filler_patterns = [
-            "please help me", "can you help me", "i need help with",
-            "i want to", "i would like to", "could you", "can you",
-            "请帮我", "你能帮我", "我想要", "我需要", "能不能", "可以吗"
-        ]
-
-        lower_cleaned = cleaned.lower()
-        for pattern in filler_patterns:
-            if lower_cleaned.startswith(pattern):
-                cleaned = cleaned[len(pattern):].strip()
-                break
+        # Strip the first matching filler prefix
+        match = FILLER_PREFIX_RE.match(cleaned.lower())
+        if match:
+            cleaned = cleaned[match.end():].strip()
 
         # Capitalize first letter
         if cleaned:
@@ -337,6 +616,17 @@ Please provide the adjusted requirement description:"""
         return cleaned
 
 
+@lru_cache(maxsize=1)
+def get_optimizer() -> RequirementOptimizer:
+    """
+    Get the process-wide RequirementOptimizer.
+
+    The optimizer owns the API client and its connection pool, so CLI and
+    Web sessions share a single instance instead of creating their own.
+    """
+    return RequirementOptimizer()
+
+
 class SessionManager:
     """
     Manages optimization sessions with state tracking.
@@ -349,27 +639,35 @@ class SessionManager:
         self.optimizer = optimizer
         self.current_requirement = ""
         self.current_feedback = ""
+        self.current_result = ""  # Latest AI response, cleared when feedback asks to change it
         self.status = "IDLE"  # IDLE, PROCESSING, WAITING_FEEDBACK, ERROR
         
         self.session_id = str(uuid.uuid4())
         logger.info(f"SessionManager initialized with ID: {self.session_id}")
 
-    async def start_session(self, user_input: str) -> Dict[str, Any]:
+    async def start_session(
+        self, user_input: str, on_chunk: Optional[Callable[[str], None]] = None
+    ) -> Dict[str, Any]:
         """
         Start a new optimization session.
 
         Args:
             user_input: Initial user requirement
+            on_chunk: Optional callback receiving response text as it streams in
 
         Returns:
             Dict with type, content, and metadata
         """
+        if not user_input.strip():
+            return self._empty_input_error()
+
         self.current_requirement = user_input
         self.current_feedback = ""
+        self.current_result = ""
         self.status = "PROCESSING"
 
         # Generate initial response
-        result = await self.optimizer.optimize_requirement(user_input)
+        result = await self.optimizer.optimize_requirement(user_input, on_chunk)
 
         if "error" in result:
             self.status = "ERROR"
@@ -383,32 +681,42 @@ class SessionManager:
             }
 
         self.status = "WAITING_FEEDBACK"
+        self._keep_result(result)
         return {
             "type": "ai_response",
             "content": result["result"],
             "response_time": result["response_time"],
-            "mode": result["mode"]
+            "mode": result["mode"],
+            "cached": result.get("cached", False)
         }
 
-    async def handle_feedback(self, feedback: str) -> Dict[str, Any]:
+    async def handle_feedback(
+        self, feedback: str, on_chunk: Optional[Callable[[str], None]] = None
+    ) -> Dict[str, Any]:
         """
         Handle user feedback in current session.
 
         Args:
             feedback: User feedback for refinement
+            on_chunk: Optional callback receiving response text as it streams in
 
         Returns:
             Dict with type, content, and metadata
         """
-        if feedback.lower() in ['/n', 'n']:
+        if feedback.lower() in NEW_CONVERSATION_COMMANDS:
             return self.reset_session()
 
+        if not feedback.strip():
+            return self._empty_input_error()
+
+        # The previous answer is being changed; it is no longer the final prompt
         self.current_feedback = feedback
+        self.current_result = ""
         self.status = "PROCESSING"
 
         # Generate refined response
         result = await self.optimizer.refine_requirement(
-            self.current_requirement, feedback
+            self.current_requirement, feedback, on_chunk
         )
 
         if "error" in result:
@@ -423,17 +731,20 @@ class SessionManager:
             }
 
         self.status = "WAITING_FEEDBACK"
+        self._keep_result(result)
         return {
             "type": "ai_response_refined",
             "content": result["result"],
             "response_time": result["response_time"],
-            "mode": result["mode"]
+            "mode": result["mode"],
+            "cached": result.get("cached", False)
         }
 
     def reset_session(self) -> Dict[str, Any]:
         """Reset current session data."""
         self.current_requirement = ""
         self.current_feedback = ""
+        self.current_result = ""
         self.status = "IDLE"
         return {
             "type": "new_conversation",
@@ -444,6 +755,20 @@ class SessionManager:
         """Get current session status."""
         return self.status
 
+    def _keep_result(self, result: Dict[str, Any]):
+        """Remember an AI response as the final prompt; fallback output is not one."""
+        if result["mode"] != FALLBACK_MODE:
+            self.current_result = result["result"]
+
+    def _empty_input_error(self) -> Dict[str, Any]:
+        """Reject blank input or feedback, leaving the session state unchanged."""
+        return {
+            "type": "error",
+            "content": "消息内容不能为空",
+            "response_time": 0,
+            "error_type": "输入错误"
+        }
+
     def _format_error_message(self, result: Dict[str, Any]) -> str:
         """Format error message with type and suggestion."""
         error_type = result.get("error_type", "错误")
@@ -463,6 +788,10 @@ class SessionManager:
         Returns:
             Final optimized prompt
         """
+        # The latest response already is the final prompt; no need to ask again
+        if self.current_result:
+            return self.current_result
+
         if self.current_feedback:
             # Use refined requirement
             result = await self.optimizer.refine_requirement(
@@ -3,17 +3,22 @@
 HTMX version of the web application with API endpoints for frontend-backend communication.
 """
 
+import asyncio
+import os
 import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from typing import Dict, Optional
 from fastapi import FastAPI, Request, HTTPException, Form, Depends, Header
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
+import orjson
 from dotenv import load_dotenv
-from core_optimizer import RequirementOptimizer, SessionManager
-from models import DatabaseManager
+from core_optimizer import AI_RESPONSE_TYPES, NEW_CONVERSATION_COMMANDS, SessionManager, get_optimizer
+from models import Conversation, ConversationMessage, DatabaseManager, FavoriteCommand
 from jwt_utils import verify_jwt_token
 from logger_config import get_logger, log_performance
 
@@ -23,6 +28,21 @@ load_dotenv()
 # Initialize logger
 logger = get_logger(__name__)
 
+# Maximum number of in-memory optimization sessions kept by the web app
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "1000"))
+
+# Message (CSS class, icon) by role for conversation history rendering
+MESSAGE_ROLE_STYLES = {
+    "user": ("user-message", "fas fa-user"),
+    "assistant": ("ai-message", "fas fa-robot"),
+    "system": ("system-message", "fas fa-info-circle")
+}
+
+
+def truncate_text(text: str, limit: int) -> str:
+    """Truncate text to limit characters, marking cut text with an ellipsis."""
+    return text[:limit] + "..." if len(text) > limit else text
+
 
 class ProxyHeadersMiddleware(BaseHTTPMiddleware):
     """Middleware to handle reverse proxy headers for correct URL generation."""
@@ -66,21 +86,48 @@ class ProxyHeadersMiddleware(BaseHTTPMiddleware):
 class HTMXOptimizer:
     """Handles optimization requests for HTMX frontend."""
     
-    def __init__(self):
-        self.optimizer = RequirementOptimizer()
-        self.sessions: Dict[str, SessionManager] = {}
+    def __init__(self, db_manager: DatabaseManager):
+        self.db_manager = db_manager
+        self.sessions: OrderedDict[str, SessionManager] = OrderedDict()
+        # Per-session locks serializing conversation saves, so the get-or-create
+        # of a session's Conversation row is never run twice at once; a lock is
+        # kept only while saves for its session are pending
+        self.save_locks: Dict[str, asyncio.Lock] = {}
+        self.pending_saves: Dict[str, int] = {}
     
     def get_session(self, session_id: str) -> SessionManager:
-        """Get or create a session manager."""
-        if session_id not in self.sessions:
-            self.sessions[session_id] = SessionManager(self.optimizer)
-        return self.sessions[session_id]
+        """Get or create a session manager, evicting the least recently used one."""
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = SessionManager(get_optimizer())
+            if len(self.sessions) > MAX_SESSIONS:
+                evicted_id, _ = self.sessions.popitem(last=False)
+                logger.debug(f"Evicted idle session {evicted_id}")
+        else:
+            self.sessions.move_to_end(session_id)
+        return session
     
     async def process_message(self, session_id: str, message: str, user_id: str = None) -> dict:
         """Process a user message and return the response."""
+        # The stripped text is only for the blank check and command matching; the
+        # message itself is processed and saved as typed. Blank messages stop
+        # before the session, cache and API
+        command = message.strip().lower()
+        if not command:
+            return {
+                "type": "error",
+                "content": "消息内容不能为空",
+                "response_time": 0,
+                "error_type": "输入错误"
+            }
+        
         session = self.get_session(session_id)
         
         try:
+            # New-conversation commands never need the API, whatever the session state
+            if command in NEW_CONVERSATION_COMMANDS:
+                return session.reset_session()
+
             # Check if this is a new conversation or feedback
             if session.get_status() == "IDLE":
                 # New requirement
@@ -89,9 +136,13 @@ class HTMXOptimizer:
                 # Feedback
                 result = await session.handle_feedback(message)
             
-            # Save conversation if user_id is provided
-            if user_id and result.get("type") in ["ai_response", "ai_response_refined"]:
-                self._save_conversation_message(user_id, session_id, message, result)
+            # Save conversation if user_id is provided; the blocking database work
+            # runs in a worker thread so other sessions' API calls keep progressing
+            if user_id and result.get("type") in AI_RESPONSE_TYPES:
+                async with self._save_lock(session_id):
+                    await asyncio.to_thread(
+                        self._save_conversation_message, user_id, session_id, message, result
+                    )
             
             return result
         except Exception as e:
@@ -103,40 +154,54 @@ class HTMXOptimizer:
                 "error_type": "ProcessingError"
             }
     
+    @asynccontextmanager
+    async def _save_lock(self, session_id: str):
+        """Hold the session's save lock, dropping it once no save is pending."""
+        lock = self.save_locks.get(session_id)
+        if lock is None:
+            lock = self.save_locks[session_id] = asyncio.Lock()
+        self.pending_saves[session_id] = self.pending_saves.get(session_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self.pending_saves[session_id] -= 1
+            if not self.pending_saves[session_id]:
+                del self.pending_saves[session_id]
+                del self.save_locks[session_id]
+
     def _save_conversation_message(self, user_id: str, session_id: str, user_message: str, ai_response: dict):
-        """Save conversation messages to database."""
+        """
+        Save conversation messages to database.
+
+        Runs in a worker thread while request handlers use the same engine on the
+        event loop. That is safe: the engine's QueuePool gives each Session its own
+        DuckDB connection to the one in-process database, DuckDB isolates concurrent
+        transactions (MVCC), and this path only inserts rows, so it cannot hit a
+        write-write conflict with other handlers.
+        """
         try:
-            from models import DatabaseManager
-            db_manager = DatabaseManager()
-            
+            db_manager = self.db_manager
+
             # Get or create conversation
             conversation = db_manager.get_conversation_by_session_id(user_id, session_id)
             if not conversation:
                 # Generate title from first user message (truncated)
-                title = user_message[:50] + "..." if len(user_message) > 50 else user_message
+                title = truncate_text(user_message, 50)
                 conversation = db_manager.create_conversation(user_id, session_id, title)
             
-            # Save user message
-            db_manager.save_message(
-                conversation.id,
-                "user",
-                user_message
-            )
-            
-            # Save AI response with metadata
-            import json
+            # Save the user message and the AI response with metadata together
             metadata = {
                 "response_time": ai_response.get("response_time", 0),
                 "mode": ai_response.get("mode", ""),
-                "type": ai_response.get("type")
+                "type": ai_response.get("type"),
+                "cached": ai_response.get("cached", False)
             }
             
-            db_manager.save_message(
-                conversation.id,
-                "assistant",
-                ai_response.get("content", ""),
-                json.dumps(metadata)
-            )
+            db_manager.save_messages(conversation.id, [
+                ("user", user_message, None),
+                ("assistant", ai_response.get("content", ""), orjson.dumps(metadata).decode()),
+            ])
             
             logger.info(f"Saved conversation messages for session {session_id}")
         except Exception as e:
@@ -148,8 +213,21 @@ class HTMXOptimizer:
         return session.reset_session()
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the shared optimizer on startup and close its API client on shutdown."""
+    optimizer = get_optimizer()
+    yield
+    # Sessions hold the optimizer; drop them with it so a later startup in this
+    # process builds a fresh optimizer instead of reusing the closed client
+    htmx_optimizer.sessions.clear()
+    get_optimizer.cache_clear()
+    await optimizer.client.close()
+    logger.info("API client closed")
+
+
 # FastAPI app setup
-app = FastAPI(title="需求优化器", description="交互式需求优化web应用")
+app = FastAPI(title="需求优化器", description="交互式需求优化web应用", lifespan=lifespan)
 
 # Add proxy headers middleware
 app.add_middleware(ProxyHeadersMiddleware)
@@ -162,16 +240,16 @@ app.mount("/static", StaticFiles(directory="frontend/static"), name="static")
 templates = Jinja2Templates(directory="frontend/templates")
 
 # Add favicon route
-@app.get("/favicon.ico")
+@app.get("/favicon.ico", include_in_schema=False)
 async def get_favicon():
     """Return a simple favicon response to avoid 404 errors."""
-    return HTMLResponse(content="", status_code=204)
+    return Response(status_code=204)
 
 # Database manager
 db_manager = DatabaseManager()
 
 # HTMX optimizer
-htmx_optimizer = HTMXOptimizer()
+htmx_optimizer = HTMXOptimizer(db_manager)
 
 
 def check_auth(request: Request):
@@ -193,6 +271,17 @@ def get_current_user(request: Request):
     return None
 
 
+def require_user(request: Request):
+    """Dependency to require session authentication and return the current user."""
+    if not check_auth(request):
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    user = get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    return user
+
+
 def get_current_user_jwt(authorization: Optional[str] = Header(None)):
     """Get current user from JWT token."""
     if not authorization:
@@ -222,6 +311,104 @@ def require_auth_jwt(user = Depends(get_current_user_jwt)):
     return user
 
 
+def render_favorite_card(favorite: FavoriteCommand) -> str:
+    """Render a favorite command card for the favorites list."""
+    return f"""
+    <div class="card mb-3">
+        <div class="card-body">
+            <h6 class="card-title">
+                {favorite.command}
+                {f'<span class="badge bg-secondary ms-2">{favorite.category}</span>' if favorite.category else ''}
+            </h6>
+            {f'<p class="card-text" style="max-height: 100px; overflow-y: auto; font-size: 0.9rem;">{favorite.description.replace(chr(10), "<br>")}</p>' if favorite.description else ''}
+            <div class="btn-group btn-group-sm">
+                <button class="btn btn-primary use-favorite" data-command="{favorite.description or favorite.command}">
+                    <i class="fas fa-copy"></i> 复制
+                </button>
+                <button class="btn btn-outline-danger" 
+                        hx-delete="/api/favorites/{favorite.id}"
+                        hx-confirm="确定要删除这个收藏命令吗？"
+                        hx-target="closest .card"
+                        hx-swap="outerHTML">
+                    <i class="fas fa-trash"></i> 删除
+                </button>
+            </div>
+        </div>
+    </div>
+    """
+
+
+def get_conversation_preview(conversation_id: str) -> str:
+    """Get a short preview of a conversation from its first message."""
+    first_message = db_manager.get_first_message(conversation_id)
+    if first_message:
+        return truncate_text(first_message.content, 100)
+    return ""
+
+
+def render_conversation_card(conversation: Conversation, preview: str) -> str:
+    """Render a conversation card for the conversation history list."""
+    return f"""
+    <div class="card mb-3">
+        <div class="card-body">
+            <h6 class="card-title">{conversation.title or 'Untitled Conversation'}</h6>
+            <p class="card-text text-muted small">{preview}</p>
+            <div class="d-flex justify-content-between align-items-center">
+                <small class="text-muted">{conversation.created_at.strftime('%Y-%m-%d %H:%M')}</small>
+                <div class="btn-group btn-group-sm">
+                    <button class="btn btn-primary btn-sm" 
+                            hx-get="/api/conversations/{conversation.id}/messages"
+                            hx-target="#conversation-detail"
+                            hx-swap="innerHTML">
+                        <i class="fas fa-eye"></i> 查看
+                    </button>
+                </div>
+            </div>
+        </div>
+    </div>
+    """
+
+
+def render_user_message(message: str) -> str:
+    """Render the user's message bubble echoed above each reply."""
+    return f"""
+        <div class="message user-message">
+            <div class="message-content">{message}</div>
+        </div>"""
+
+
+def render_conversation_message(msg: ConversationMessage) -> str:
+    """Render a stored message for the conversation detail view."""
+    role_class, role_icon = MESSAGE_ROLE_STYLES.get(msg.role, MESSAGE_ROLE_STYLES["system"])
+    
+    # Parse metadata if available
+    metadata_info = ""
+    if msg.message_metadata:
+        try:
+            metadata = orjson.loads(msg.message_metadata)
+            if metadata.get("response_time"):
+                metadata_info = f'<small class="text-muted">⏱️ {metadata["response_time"]:.2f}s</small>'
+        except (ValueError, TypeError, AttributeError):
+            pass
+    
+    return f"""
+    <div class="message {role_class} mb-3">
+        <div class="d-flex">
+            <div class="me-2">
+                <i class="{role_icon}"></i>
+            </div>
+            <div class="flex-grow-1">
+                <div class="message-content">{msg.content.replace(chr(10), '<br>')}</div>
+                <div class="message-meta mt-1">
+                    <small class="text-muted">{msg.created_at.strftime('%H:%M:%S')}</small>
+                    {metadata_info}
+                </div>
+            </div>
+        </div>
+    </div>
+    """
+
+
 # Routes
 @app.get("/", response_class=HTMLResponse)
 async def get_index(request: Request):
@@ -321,15 +508,8 @@ async def api_logout(request: Request):
 
 
 @app.post("/api/send-message")
-async def send_message(request: Request, message: str = Form(...)):
+async def send_message(request: Request, message: str = Form(...), user = Depends(require_user)):
     """Handle message sending via HTMX."""
-    if not check_auth(request):
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
-    user = get_current_user(request)
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
-    
     # Get session ID from user session
     session_id = request.session.get("htmx_session_id")
     if not session_id:
@@ -340,7 +520,7 @@ async def send_message(request: Request, message: str = Form(...)):
     response = await htmx_optimizer.process_message(session_id, message, user.id)
     
     # Create HTML response based on the response type
-    if response["type"] == "ai_response" or response["type"] == "ai_response_refined":
+    if response["type"] in AI_RESPONSE_TYPES:
         content = response["content"]
         response_time = response.get("response_time", 0)
         mode = response.get("mode", "")
@@ -350,10 +530,7 @@ async def send_message(request: Request, message: str = Form(...)):
         formatted_content = content.replace('\n', '<br>')
         formatted_content = formatted_content.replace('**', '<strong>')
         
-        html = f"""
-        <div class="message user-message">
-            <div class="message-content">{message}</div>
-        </div>
+        reply_html = f"""
         <div class="message ai-message">
             <div class="message-content">{formatted_content}</div>
             <div class="message-meta">
@@ -378,10 +555,7 @@ async def send_message(request: Request, message: str = Form(...)):
         content = response["content"]
         error_type = response.get("error_type", "")
         
-        html = f"""
-        <div class="message user-message">
-            <div class="message-content">{message}</div>
-        </div>
+        reply_html = f"""
         <div class="message error-message">
             <div class="message-content">
                 <i class="fas fa-exclamation-triangle"></i> {content}
@@ -399,10 +573,7 @@ async def send_message(request: Request, message: str = Form(...)):
         """
     else:
         # Default response
-        html = f"""
-        <div class="message user-message">
-            <div class="message-content">{message}</div>
-        </div>
+        reply_html = f"""
         <div class="message system-message">
             <div class="message-content">
                 <i class="fas fa-info-circle"></i> 消息已收到
@@ -410,19 +581,12 @@ async def send_message(request: Request, message: str = Form(...)):
         </div>
         """
     
-    return HTMLResponse(content=html)
+    return HTMLResponse(content=render_user_message(message) + reply_html)
 
 
 @app.post("/api/new-conversation")
-async def new_conversation(request: Request):
+async def new_conversation(request: Request, user = Depends(require_user)):
     """Start a new conversation."""
-    if not check_auth(request):
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
-    user = get_current_user(request)
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
-    
     # Get session ID
     session_id = request.session.get("htmx_session_id")
     if not session_id:
@@ -443,45 +607,14 @@ async def new_conversation(request: Request):
 
 
 @app.get("/api/favorites-modal")
-async def get_favorites_modal(request: Request):
+async def get_favorites_modal(user = Depends(require_user)):
     """Get favorites modal content."""
-    if not check_auth(request):
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
-    user = get_current_user(request)
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
-    
     # Get user's favorites
     favorites = db_manager.get_user_favorite_commands(user.id)
     
     # Generate favorites list HTML
-    favorites_html = ""
     if favorites:
-        for fav in favorites:
-            favorites_html += f"""
-            <div class="card mb-3">
-                <div class="card-body">
-                    <h6 class="card-title">
-                        {fav.command}
-                        {f'<span class="badge bg-secondary ms-2">{fav.category}</span>' if fav.category else ''}
-                    </h6>
-                    {f'<p class="card-text" style="max-height: 100px; overflow-y: auto; font-size: 0.9rem;">{fav.description.replace(chr(10), "<br>")}</p>' if fav.description else ''}
-                    <div class="btn-group btn-group-sm">
-                        <button class="btn btn-primary use-favorite" data-command="{fav.description or fav.command}">
-                            <i class="fas fa-copy"></i> 复制
-                        </button>
-                        <button class="btn btn-outline-danger" 
-                                hx-delete="/api/favorites/{fav.id}"
-                                hx-confirm="确定要删除这个收藏命令吗？"
-                                hx-target="closest .card"
-                                hx-swap="outerHTML">
-                            <i class="fas fa-trash"></i> 删除
-                        </button>
-                    </div>
-                </div>
-            </div>
-            """
+        favorites_html = "".join(render_favorite_card(fav) for fav in favorites)
     else:
         favorites_html = '<div class="alert alert-info">还没有收藏的命令</div>'
     
@@ -554,19 +687,12 @@ async def get_add_favorite_form():
 
 @app.post("/api/favorites")
 async def create_favorite_command(
-    request: Request,
     command: str = Form(...),
     description: Optional[str] = Form(None),
-    category: Optional[str] = Form(None)
+    category: Optional[str] = Form(None),
+    user = Depends(require_user)
 ):
     """Create a new favorite command via HTMX."""
-    if not check_auth(request):
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
-    user = get_current_user(request)
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
-    
     logger.info(f"User {user.username} creating favorite command: {command}")
     
     if db_manager.check_favorite_exists(user.id, command):
@@ -577,41 +703,12 @@ async def create_favorite_command(
     
     favorite = db_manager.create_favorite_command(user.id, command, description, category)
     
-    return HTMLResponse(content=f"""
-    <div class="card mb-3">
-        <div class="card-body">
-            <h6 class="card-title">
-                {favorite.command}
-                {f'<span class="badge bg-secondary ms-2">{favorite.category}</span>' if favorite.category else ''}
-            </h6>
-            {f'<p class="card-text" style="max-height: 100px; overflow-y: auto; font-size: 0.9rem;">{favorite.description.replace(chr(10), "<br>")}</p>' if favorite.description else ''}
-            <div class="btn-group btn-group-sm">
-                <button class="btn btn-primary use-favorite" data-command="{favorite.description or favorite.command}">
-                    <i class="fas fa-copy"></i> 复制
-                </button>
-                <button class="btn btn-outline-danger" 
-                        hx-delete="/api/favorites/{favorite.id}"
-                        hx-confirm="确定要删除这个收藏命令吗？"
-                        hx-target="closest .card"
-                        hx-swap="outerHTML">
-                    <i class="fas fa-trash"></i> 删除
-                </button>
-            </div>
-        </div>
-    </div>
-    """)
+    return HTMLResponse(content=render_favorite_card(favorite))
 
 
 @app.delete("/api/favorites/{favorite_id}")
-async def delete_favorite_command(request: Request, favorite_id: str):
+async def delete_favorite_command(favorite_id: str, user = Depends(require_user)):
     """Delete a favorite command via HTMX."""
-    if not check_auth(request):
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
-    user = get_current_user(request)
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
-    
     success = db_manager.delete_favorite_command(favorite_id, user.id)
     if not success:
         return HTMLResponse(
@@ -623,45 +720,15 @@ async def delete_favorite_command(request: Request, favorite_id: str):
 
 
 @app.get("/api/conversations")
-async def get_conversations(request: Request):
+async def get_conversations(user = Depends(require_user)):
     """Get conversation history for the current user."""
-    if not check_auth(request):
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
-    user = get_current_user(request)
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
-    
     conversations = db_manager.get_user_conversations(user.id)
     
-    conversations_html = ""
     if conversations:
-        for conv in conversations:
-            # Get first few messages for preview
-            messages = db_manager.get_conversation_messages(conv.id)
-            preview = ""
-            if messages:
-                preview = messages[0].content[:100] + "..." if len(messages[0].content) > 100 else messages[0].content
-            
-            conversations_html += f"""
-            <div class="card mb-3">
-                <div class="card-body">
-                    <h6 class="card-title">{conv.title or 'Untitled Conversation'}</h6>
-                    <p class="card-text text-muted small">{preview}</p>
-                    <div class="d-flex justify-content-between align-items-center">
-                        <small class="text-muted">{conv.created_at.strftime('%Y-%m-%d %H:%M')}</small>
-                        <div class="btn-group btn-group-sm">
-                            <button class="btn btn-primary btn-sm" 
-                                    hx-get="/api/conversations/{conv.id}/messages"
-                                    hx-target="#conversation-detail"
-                                    hx-swap="innerHTML">
-                                <i class="fas fa-eye"></i> 查看
-                            </button>
-                        </div>
-                    </div>
-                </div>
-            </div>
-            """
+        conversations_html = "".join(
+            render_conversation_card(conv, get_conversation_preview(conv.id))
+            for conv in conversations
+        )
     else:
         conversations_html = '<div class="alert alert-info">还没有对话记录</div>'
     
@@ -701,58 +768,11 @@ async def get_conversations(request: Request):
 
 
 @app.get("/api/conversations/{conversation_id}/messages")
-async def get_conversation_messages(request: Request, conversation_id: str):
+async def get_conversation_messages(conversation_id: str, user = Depends(require_user)):
     """Get messages for a specific conversation."""
-    if not check_auth(request):
-        raise HTTPException(status_code=401, detail="Authentication required")
-    
-    user = get_current_user(request)
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
-    
     messages = db_manager.get_conversation_messages(conversation_id)
     
-    messages_html = ""
-    for msg in messages:
-        role_class = {
-            "user": "user-message",
-            "assistant": "ai-message", 
-            "system": "system-message"
-        }.get(msg.role, "system-message")
-        
-        role_icon = {
-            "user": "fas fa-user",
-            "assistant": "fas fa-robot",
-            "system": "fas fa-info-circle"
-        }.get(msg.role, "fas fa-info-circle")
-        
-        # Parse metadata if available
-        metadata_info = ""
-        if msg.message_metadata:
-            try:
-                import json
-                metadata = json.loads(msg.message_metadata)
-                if metadata.get("response_time"):
-                    metadata_info = f'<small class="text-muted">⏱️ {metadata["response_time"]:.2f}s</small>'
-            except:
-                pass
-        
-        messages_html += f"""
-        <div class="message {role_class} mb-3">
-            <div class="d-flex">
-                <div class="me-2">
-                    <i class="{role_icon}"></i>
-                </div>
-                <div class="flex-grow-1">
-                    <div class="message-content">{msg.content.replace(chr(10), '<br>')}</div>
-                    <div class="message-meta mt-1">
-                        <small class="text-muted">{msg.created_at.strftime('%H:%M:%S')}</small>
-                        {metadata_info}
-                    </div>
-                </div>
-            </div>
-        </div>
-        """
+    messages_html = "".join(render_conversation_message(msg) for msg in messages)
     
     return HTMLResponse(content=f"""
     <div>
@@ -5,7 +5,7 @@ JWT utilities for authentication.
 
 import jwt
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict, Any
 from dotenv import load_dotenv
 from logger_config import get_logger
@@ -23,11 +23,12 @@ JWT_EXPIRATION_HOURS = 24
 def generate_jwt_token(user_id: str, username: str) -> str:
     """Generate JWT token for user."""
     logger.info(f"Generating JWT token for user: {username} (ID: {user_id})")
+    now = datetime.now(timezone.utc)
     payload = {
         "user_id": user_id,
         "username": username,
-        "exp": datetime.utcnow() + timedelta(hours=JWT_EXPIRATION_HOURS),
-        "iat": datetime.utcnow()
+        "exp": now + timedelta(hours=JWT_EXPIRATION_HOURS),
+        "iat": now
     }
     token = jwt.encode(payload, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
     logger.debug(f"JWT token generated successfully for user: {username}")
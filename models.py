@@ -4,9 +4,9 @@ Database models using SQLModel and DuckDB.
 """
 
 import uuid
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from sqlmodel import SQLModel, Field, Session, create_engine, select
-from datetime import datetime
+from datetime import datetime, timedelta
 import bcrypt
 from database_config import db_config
 from logger_config import get_logger
@@ -18,7 +18,7 @@ logger = get_logger(__name__)
 class User(SQLModel, table=True):
     """User model for authentication."""
     
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex, primary_key=True)
     username: str = Field(index=True, unique=True)
     hashed_password: str
     is_active: bool = Field(default=True)
@@ -30,7 +30,7 @@ class User(SQLModel, table=True):
 class Conversation(SQLModel, table=True):
     """Conversation model for storing user chat sessions."""
     
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex, primary_key=True)
     user_id: str = Field(foreign_key="user.id", index=True)
     session_id: str = Field(index=True)
     title: Optional[str] = Field(default=None)
@@ -42,7 +42,7 @@ class Conversation(SQLModel, table=True):
 class ConversationMessage(SQLModel, table=True):
     """Individual messages within a conversation."""
     
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex, primary_key=True)
     conversation_id: str = Field(foreign_key="conversation.id", index=True)
     role: str = Field(index=True)  # user, assistant, system
     content: str
@@ -53,7 +53,7 @@ class ConversationMessage(SQLModel, table=True):
 class FavoriteCommand(SQLModel, table=True):
     """Favorite command model for users."""
     
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex, primary_key=True)
     user_id: str = Field(foreign_key="user.id", index=True)
     command: str = Field(index=True)
     description: Optional[str] = Field(default=None)
@@ -322,6 +322,30 @@ class DatabaseManager:
             session.refresh(message)
             return message
     
+    def save_messages(self, conversation_id: str, messages: List[Tuple[str, str, Optional[str]]]) -> List[ConversationMessage]:
+        """Save several (role, content, message_metadata) messages in one transaction."""
+        logger.debug(f"Saving {len(messages)} messages to conversation {conversation_id}")
+        # Messages are ordered by created_at alone, so give each row a strictly
+        # later timestamp than the one before it to keep their order on reload
+        created_at = datetime.now()
+        rows = [
+            ConversationMessage(
+                conversation_id=conversation_id,
+                role=role,
+                content=content,
+                message_metadata=message_metadata,
+                created_at=created_at + timedelta(microseconds=index)
+            )
+            for index, (role, content, message_metadata) in enumerate(messages)
+        ]
+        
+        with self.get_session() as session:
+            # Ids and timestamps are generated client-side, so skip the per-row refresh
+            session.expire_on_commit = False
+            session.add_all(rows)
+            session.commit()
+            return rows
+    
     def get_conversation_messages(self, conversation_id: str) -> List[ConversationMessage]:
         """Get all messages for a conversation."""
         with self.get_session() as session:
@@ -338,6 +362,24 @@ class DatabaseManager:
                 created_at=msg.created_at
             ) for msg in messages]
     
+    def get_first_message(self, conversation_id: str) -> Optional[ConversationMessage]:
+        """Get the earliest message of a conversation."""
+        with self.get_session() as session:
+            statement = select(ConversationMessage).where(
+                ConversationMessage.conversation_id == conversation_id
+            ).order_by(ConversationMessage.created_at).limit(1)
+            msg = session.exec(statement).first()
+            if msg:
+                return ConversationMessage(
+                    id=msg.id,
+                    conversation_id=msg.conversation_id,
+                    role=msg.role,
+                    content=msg.content,
+                    message_metadata=msg.message_metadata,
+                    created_at=msg.created_at
+                )
+            return None
+    
     def get_user_conversations(self, user_id: str, limit: int = 50) -> List[Conversation]:
         """Get all conversations for a user."""
         with self.get_session() as session:
@@ -7,42 +7,70 @@ import asyncio
 import argparse
 import signal
 import sys
-from core_optimizer import RequirementOptimizer, SessionManager
+from core_optimizer import (
+    AI_RESPONSE_TYPES,
+    EXIT_COMMANDS,
+    NEW_CONVERSATION_COMMANDS,
+    SessionManager,
+    get_optimizer,
+)
 from logger_config import get_logger
 
 # Initialize logger
 logger = get_logger(__name__)
 
 
+class StreamPrinter:
+    """Print streamed response chunks to the terminal as they arrive."""
+
+    def __init__(self, label: str):
+        """Initialize printer with the label shown before the first chunk."""
+        self.label = label
+        self.started = False
+
+    def __call__(self, chunk: str):
+        """Print a streamed chunk, preceded by the label on the first call."""
+        if not self.started:
+            print(f"\n{self.label}", end="", flush=True)
+            self.started = True
+        print(chunk, end="", flush=True)
+
+
 class CLIInterface:
     """CLI interface for the requirement optimizer."""
 
     def __init__(self):
         """Initialize CLI with core optimizer."""
         logger.info("Initializing CLI interface")
-        self.optimizer = RequirementOptimizer()
+        self.optimizer = get_optimizer()
         self.session = SessionManager(self.optimizer)
         logger.info("CLI interface initialized successfully")
 
     async def start_session(self, user_input: str):
         """Start a new optimization session and display results."""
         logger.info(f"Starting new session with input: {user_input[:50]}...")
-        result = await self.session.start_session(user_input)
-        self._display_result(result)
+        printer = StreamPrinter("🤖 AI回复: ")
+        result = await self.session.start_session(user_input, on_chunk=printer)
+        self._display_result(result, streamed=printer.started)
         return result["type"]
 
     async def handle_feedback(self, feedback: str):
         """Handle user feedback and display results."""
         logger.info(f"Processing feedback: {feedback[:50]}...")
-        result = await self.session.handle_feedback(feedback)
-        self._display_result(result)
+        printer = StreamPrinter("🤖 AI调整后回复: ")
+        result = await self.session.handle_feedback(feedback, on_chunk=printer)
+        self._display_result(result, streamed=printer.started)
         return result["type"]
 
-    def _display_result(self, result: dict):
+    def _display_result(self, result: dict, streamed: bool = False):
         """Display result to user in CLI format."""
         result_type = result["type"]
         content = result["content"]
 
+        # Streamed content is already on screen; just terminate the line
+        if streamed:
+            print()
+
         if result_type == "error":
             print(f"\n❌ {content}")
             if "response_time" in result:
@@ -59,12 +87,14 @@ class CLIInterface:
             print("  3. 输入 '/n' 开始新对话")
 
         elif result_type == "ai_response":
-            print(f"\n🤖 AI回复: {content}")
+            if not streamed:
+                print(f"\n🤖 AI回复: {content}")
             self._display_metadata(result)
             self._display_options()
 
         elif result_type == "ai_response_refined":
-            print(f"\n🤖 AI调整后回复: {content}")
+            if not streamed:
+                print(f"\n🤖 AI调整后回复: {content}")
             self._display_metadata(result)
             self._display_options()
 
@@ -119,11 +149,12 @@ async def main():
                 print("\n再见!")
                 break
 
-            if user_input.lower() in ['quit', 'exit', 'q']:
+            command = user_input.lower()
+            if command in EXIT_COMMANDS:
                 print("再见!")
                 break
 
-            if user_input.lower() in ['/n', 'n']:
+            if command in NEW_CONVERSATION_COMMANDS:
                 cli.session.reset_session()
                 session_active = False
                 print("✨ 开始新对话\n")
@@ -137,7 +168,7 @@ async def main():
                     # Start new session
                     print("处理中...")
                     result_type = await cli.start_session(user_input)
-                    if result_type in ["ai_response", "ai_response_refined"]:
+                    if result_type in AI_RESPONSE_TYPES:
                         session_active = True
                 else:
                     # Handle feedback in current session
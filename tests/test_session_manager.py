@@ -0,0 +1,71 @@
+"""
+Tests for SessionManager state tracking.
+"""
+
+import asyncio
+
+from core_optimizer import FALLBACK_MODE, SessionManager
+
+
+class FakeOptimizer:
+    """Optimizer double returning queued results and recording calls."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = []
+
+    async def optimize_requirement(self, user_input, on_chunk=None):
+        self.calls.append(("optimize", user_input))
+        return self.results.pop(0)
+
+    async def refine_requirement(self, initial_result, feedback, on_chunk=None):
+        self.calls.append(("refine", feedback))
+        return self.results.pop(0)
+
+
+def ok(text):
+    return {"result": text, "response_time": 0.1, "mode": "标准模式"}
+
+
+def failed():
+    return {"error": "boom", "error_type": "连接错误", "response_time": 0.1}
+
+
+def test_final_prompt_after_failed_then_successful_refinement():
+    optimizer = FakeOptimizer(ok("v1"), failed(), ok("v2"))
+    session = SessionManager(optimizer)
+
+    async def run():
+        await session.start_session("make a table")
+        assert (await session.handle_feedback("add a column"))["type"] == "error"
+        await session.handle_feedback("add a column")
+        return await session.generate_final_prompt()
+
+    assert asyncio.run(run()) == "v2"
+    assert len(optimizer.calls) == 3
+
+
+def test_final_prompt_after_failed_refinement_is_not_the_old_answer():
+    optimizer = FakeOptimizer(ok("v1"), failed(), ok("v2"))
+    session = SessionManager(optimizer)
+
+    async def run():
+        await session.start_session("make a table")
+        await session.handle_feedback("add a column")
+        return await session.generate_final_prompt()
+
+    assert asyncio.run(run()) == "v2"
+    assert optimizer.calls[-1] == ("refine", "add a column")
+
+
+def test_final_prompt_ignores_fallback_result():
+    fallback = {"result": "cleaned input", "response_time": 0, "mode": FALLBACK_MODE}
+    optimizer = FakeOptimizer(ok("v1"), fallback, ok("v2"))
+    session = SessionManager(optimizer)
+
+    async def run():
+        await session.start_session("make a table")
+        await session.handle_feedback("add a column")
+        return await session.generate_final_prompt()
+
+    assert asyncio.run(run()) == "v2"